@@ -7,6 +7,8 @@ import pickle
 import matplotlib.pyplot as plt
 import glob
 import itertools
+import os
+from collections.abc import Mapping
 from postproengine import get_mapping_xyz_to_axis1axis2
 from postproengine import apply_coordinate_transform
 from mpl_toolkits.axes_grid1 import make_axes_locatable
@@ -133,8 +135,98 @@ def sortAndSpliceFileList(ncfilelist, splicepriority='laterfiles'):
         outtimevec.append(alltimesdict[f])
     return sortedfilelist, extractbounds, outtimevec
 
+class LazyDatasets():
+    """
+    Open netcdf datasets shared by all LazyPlaneVar variables of one
+    getPlaneXR() call, so each file/group is opened only once.
+    """
+    def __init__(self):
+        self.datasets = {}
+        self.pid      = os.getpid()
+        return
+
+    def get(self, ncfile, group):
+        # Don't share open file handles with forked processes
+        if self.pid != os.getpid():
+            self.datasets = {}
+            self.pid = os.getpid()
+        if (ncfile, group) not in self.datasets:
+            self.datasets[(ncfile, group)] = xr.open_dataset(ncfile, group=group)
+        return self.datasets[(ncfile, group)]
+
+    def close(self):
+        for ds in self.datasets.values():
+            ds.close()
+        self.datasets = {}
+        return
+
+    def __getstate__(self):
+        # Open datasets can't be pickled
+        state = self.__dict__.copy()
+        state['datasets'] = {}
+        return state
+
+class LazyPlaneVar(Mapping):
+    """
+    Dictionary-like {itime:plane data} for one variable, where each plane
+    is only read from the netcdf file when it is accessed.  The files are
+    opened through datasets, a LazyDatasets object.
+
+    If component is given, the variable is that component (0, 1, or 2)
+    of the velocity transformed by the rotation matrix R.
+    """
+    def __init__(self, varname, datasets, R=None, component=None):
+        self.varname   = varname
+        self.datasets  = datasets
+        self.R         = R
+        self.component = component
+        self.locations = {}
+        return
+
+    def add(self, itime, ncfile, group, local_ind):
+        self.locations[itime] = (ncfile, group, local_ind)
+        return
+
+    def __getitem__(self, itime):
+        ncfile, group, local_ind = self.locations[itime]
+        ds = self.datasets.get(ncfile, group)
+        if self.component is None:
+            return extractvar(ds, self.varname, local_ind)
+        vvarx = extractvar(ds, 'velocityx', local_ind)
+        vvary = extractvar(ds, 'velocityy', local_ind)
+        vvarz = extractvar(ds, 'velocityz', local_ind)
+        return apply_coordinate_transform(self.R,vvarx,vvary,vvarz)[self.component]
+
+    def __iter__(self):
+        return iter(self.locations)
+
+    def __len__(self):
+        return len(self.locations)
+
+def loadLazyPlanes(db):
+    """
+    Return a copy of db where all LazyPlaneVar variables are read into
+    regular dictionaries
+    """
+    return {k:(dict(v) if isinstance(v, LazyPlaneVar) else v) for k, v in db.items()}
+
+def closeLazyPlanes(db):
+    """
+    Close the netcdf files opened by the LazyPlaneVar variables in db
+    """
+    for v in db.values():
+        if isinstance(v, LazyPlaneVar):
+            v.datasets.close()
+    return
+
 def getPlaneXR(ncfileinput, itimevec, varnames, groupname=None,
-               verbose=0, includeattr=False, gettimes=False,timerange=None,times=None, axis_rotation=0):
+               verbose=0, includeattr=False, gettimes=False,timerange=None,times=None, axis_rotation=0,
+               lazy=False):
+    """
+    Extract the planes at itimevec (and/or times, timerange) from the
+    netcdf files.  If lazy=True, the plane variables are LazyPlaneVar
+    objects which only read a plane from disk when it is accessed.
+    """
 
     ncfilelist = getFileList(ncfileinput)
     ncfilelistsorted, extracttimes, timevecs = sortAndSpliceFileList(ncfilelist, splicepriority='laterfiles')
@@ -146,6 +238,8 @@ def getPlaneXR(ncfileinput, itimevec, varnames, groupname=None,
 
     find_nearest = lambda a, a0: np.abs(np.array(a) - a0).argmin()
 
+    db_varnames = list(varnames)
+
     #Apply transformation after computing cartesian average
     transform=False
     if varnames == ['velocitya1','velocitya2','velocitya3']:
@@ -195,6 +289,10 @@ def getPlaneXR(ncfileinput, itimevec, varnames, groupname=None,
                 except:
                     db['axis3'] = ds.attrs['axis3']
                 R=get_mapping_xyz_to_axis1axis2(db['axis1'],db['axis2'],db['axis3'],rot=axis_rotation)
+                if lazy:
+                    datasets = LazyDatasets()
+                    for icomp, v in enumerate(db_varnames):
+                        db[v] = LazyPlaneVar(v, datasets, R=R, component=icomp) if transform else LazyPlaneVar(v, datasets)
             for itime in itimevec:
                 time = all_timevecs[itime]
                 if itime not in itime_processed and time >= extracttime[0] and time <= extracttime[1]:
@@ -205,7 +303,10 @@ def getPlaneXR(ncfileinput, itimevec, varnames, groupname=None,
                     db['timesteps'].append(itime)
                     if gettimes:
                         db['times'].append(float(all_timevecs[itime]))
-                    if not transform:
+                    if lazy:
+                        for v in db_varnames:
+                            db[v].add(itime, ncfile, group, local_ind)
+                    elif not transform:
                         for v in varnames:
                             vvar = extractvar(ds, v, local_ind)
                             db[v][itime] = vvar
@@ -13,12 +13,17 @@ import postproamrwindsample_xarray as ppsamplexr
 import postproamrwindsample as ppsample
 import numpy as np
 import pickle
+import matplotlib
 import matplotlib.pyplot as plt
+from matplotlib.colors import BoundaryNorm
 from mpl_toolkits.axes_grid1 import make_axes_locatable
 from postproengine import convert_vel_xyz_to_axis1axis2
-import cv2
-from postproengine import spod
 import re
+import shutil
+import subprocess
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
 import plotfunctions
 
 try:
@@ -33,6 +38,289 @@ Plugin for creating instantaneous planar images
 See README.md for details on the structure of classes here
 """
 
+# Splits a title into LaTeX math ($...$) and plain text parts
+_TITLE_RE = re.compile(r'(\$.*?\$)')
+# Finds string subscripts like db['velocityx'] in a plotfunc
+_STRKEY_RE = re.compile(r'\[\s*[\'"]')
+
+def _format_title(titleparts, titlefields):
+    """
+    Join the title parts, formatting the plain text parts with titlefields.
+    LaTeX math parts are left as is.
+    """
+    try:
+        return ''.join([part.format_map(titlefields) if doformat else part
+                        for doformat, part in titleparts])
+    except KeyError as e:
+        raise ValueError('Unsupported field {%s} in title, the supported fields are '%e.args[0]+
+                         ', '.join(titlefields.keys())) from None
+    except (ValueError, IndexError) as e:
+        title = ''.join([part for doformat, part in titleparts])
+        raise ValueError('Cannot format title %s: %s'%(repr(title), str(e))) from None
+
+def _render_frames(frames, opts):
+    """
+    Plot and save a sequence of instantaneous plane frames
+
+    frames is an iterable of (iplot, i, time, plotq) tuples, where plotq is
+    the 2D field on the plane.  opts is the plot actiondict together with the
+    evaluated clevels, title parts, and scaled plane coordinates (see
+    plot.execute)
+    """
+    iplane   = opts['iplane']
+    titleparts = opts['titleparts']
+    clevels  = opts['clevels']
+    cmap     = opts['cmap']
+    cbar_inc = opts['cbar']
+    cbar_nticks = opts['cbar_nticks']
+    cbar_label = opts['cbar_label']
+    xlabel   = opts['xlabel']
+    ylabel   = opts['ylabel']
+    xlim     = opts['xlim']
+    ylim     = opts['ylim']
+    savefile = opts['savefile']
+    dpi      = opts['dpi']
+    figsize  = opts['figsize']
+    fontsize = opts['fontsize']
+    postplotfunc = opts['postplotfunc']
+    xgrid    = opts['xgrid']
+    ygrid    = opts['ygrid']
+    figname  = opts['figname']
+    axesnum  = opts['axesnum']
+    axisscale= opts['axisscale']
+    plotturbs= opts['plotturbines']
+    plotmethod = opts['plotmethod']
+    cacheframes= opts['cacheframes']
+
+    # When the frames are only written out (or cached), create our own
+    # figure once and only update the plotted field and title for every
+    # frame.  Otherwise every frame gets its own figure, as does a
+    # postplotfunc (which may depend on the frame) or contourf choosing
+    # its own levels (which would leave the colorbar stale).
+    usefig   = axesnum is not None
+    saveframes = (len(savefile)>0) or cacheframes
+    reusefig = (not usefig) and saveframes and (len(postplotfunc)==0) and (np.ndim(clevels)==1)
+    usepcolor= (plotmethod == 'pcolormesh') and (not usefig)
+    if reusefig:
+        fig, ax = plt.subplots(1,1,figsize=(figsize[0],figsize[1]), dpi=dpi)
+    if usepcolor:
+        # Each cell gets one color, binned by clevels like
+        # contourf(levels=clevels, extend='both')
+        cmapobj = plt.get_cmap(cmap)
+        norm    = BoundaryNorm(clevels, ncolors=cmapobj.N, extend='both')
+    c = None
+    cachedframes = []
+
+    for iplot, i, time, plotq in frames:
+        # SET TITLE
+        titlefields = {'time':time, 'iter':i, 'i':i, 'iplane':iplane, 'iplot':iplot}
+        evaltitle = _format_title(titleparts, titlefields)
+        if reusefig and (c is not None):
+            if usepcolor:
+                c.set_array(plotq.ravel())
+            else:
+                # Replace the contours from the previous frame
+                try:
+                    c.remove()
+                except AttributeError:
+                    # matplotlib < 3.8
+                    for coll in c.collections: coll.remove()
+                # Keep the new contours below the turbines etc. which were
+                # drawn on top of the first ones
+                c = ax.contourf(xgrid, ygrid,
+                                plotq, levels=clevels, cmap=cmap, extend='both',
+                                zorder=czorder-1e-3)
+            ax.set_title(evaltitle,fontsize=fontsize)
+        else:
+            if usefig:
+                fig     = plt.figure(figname)
+                allaxes = fig.get_axes()
+                ax      = allaxes[axesnum]
+            elif not reusefig:
+                fig, ax = plt.subplots(1,1,figsize=(figsize[0],figsize[1]), dpi=dpi)
+            if usepcolor:
+                c = ax.pcolormesh(xgrid, ygrid,
+                                  plotq, cmap=cmapobj, norm=norm, shading='nearest')
+            else:
+                c = ax.contourf(xgrid, ygrid,
+                                plotq, levels=clevels, cmap=cmap, extend='both')
+                try:
+                    czorder = c.get_zorder()
+                except AttributeError:
+                    # matplotlib < 3.8
+                    czorder = c.collections[0].get_zorder()
+            if cbar_inc:
+                divider = make_axes_locatable(ax)
+                cax = divider.append_axes("right", size="3%", pad=0.05)
+                cbar=fig.colorbar(c, ax=ax, cax=cax, extend='both')
+                cbar.ax.tick_params(labelsize=fontsize)
+                if cbar_label is not None:
+                    cbar.set_label(cbar_label,fontsize=fontsize)
+
+                if cbar_nticks is not None:
+                    levels = c.levels if not usepcolor else clevels
+                    cbar.set_ticks(np.linspace(levels[0], levels[-1], cbar_nticks))
+
+            if (xlabel is not None): ax.set_xlabel(xlabel,fontsize=fontsize)
+            if (ylabel is not None): ax.set_ylabel(ylabel,fontsize=fontsize)
+            ax.tick_params(axis='both', which='major', labelsize=fontsize) 
+            ax.set_title(evaltitle,fontsize=fontsize)
+            if axisscale is not None:
+                ax.axis(axisscale)
+
+            if xlim is not None:
+                ax.set_xlim(xlim[0],xlim[1])
+
+            if ylim is not None:
+                ax.set_ylim(ylim[0],ylim[1])
+
+            # Plot turbines
+            if plotturbs:
+                axismapping = {'x':0, 'a1':0, 'y':1, 'a2':1, 'z':2, 'a3':2}
+                defaultlstyle =  {'lw':1, 'color':'k', 'alpha':0.75}
+                for turb in plotturbs:
+                    basexyz   = turb['basexyz']
+                    hubheight = turb['hubheight']
+                    turbD     = turb['rotordiameter']
+                    nacelledir= turb['nacelledir']
+                    ix        = turb['ix'] if 'ix' in turb else axismapping[opts['xaxis']]
+                    iy        = turb['iy'] if 'iy' in turb else axismapping[opts['yaxis']]
+                    lstyle    = turb['linestyle'] if 'linestyle' in turb else defaultlstyle
+                    plotfunctions.plotTurbine(ax, basexyz, hubheight, turbD, nacelledir, ix, iy,
+                                              **lstyle)
+
+            # Run any post plot functions
+            if len(postplotfunc)>0:
+                modname = postplotfunc.split('.')[0]
+                funcname = postplotfunc.split('.')[1]
+                func = getattr(sys.modules[modname], funcname)
+                func(fig, ax)
+
+        savefname = savefile.format(time=time, iplane=iplane, iter=i)
+        saveppm   = savefname.lower().endswith('.ppm')
+        rgb = _canvas_rgb(fig) if (cacheframes or saveppm) else None
+        if len(savefile)>0:
+            if saveppm:
+                _write_ppm(rgb, savefname)
+            else:
+                fig.savefig(savefname)
+        if cacheframes:
+            cachedframes.append(rgb)
+        # Don't keep the figure of each frame around if it went to a file
+        if (not usefig) and (not reusefig) and saveframes:
+            plt.close(fig)
+
+    if reusefig:
+        plt.close(fig)
+    return cachedframes
+
+def _makedirs(filenames):
+    """
+    Create the directories for all filenames, with one os.makedirs call
+    per distinct directory
+    """
+    for directory in set(os.path.dirname(f) for f in filenames):
+        if len(directory)>0:
+            os.makedirs(directory, exist_ok=True)
+    return
+
+def _canvas_rgb(fig):
+    """
+    Draw the figure and return a copy of its pixels as an
+    [height, width, 3] uint8 RGB array
+    """
+    fig.canvas.draw()
+    return np.ascontiguousarray(np.asarray(fig.canvas.buffer_rgba())[:,:,:3])
+
+def _write_ppm(rgb, fname):
+    """
+    Write an RGB frame as an uncompressed binary PPM image, which is much
+    faster than PNG encoding
+    """
+    height, width = rgb.shape[:2]
+    with open(fname, 'wb') as f:
+        f.write(b'P6\n%d %d\n255\n'%(width, height))
+        f.write(rgb.tobytes())
+    return
+
+def _ffmpeg_encode(ffmpeg, video_name, fps, images=None, frames=None):
+    """
+    Encode a list of image files, or a list of in-memory RGB frames, into
+    an h264 video using ffmpeg
+
+    The image files are piped to ffmpeg as is, so they are decoded only
+    once by ffmpeg itself.  The RGB frames are piped as raw video.  Raises
+    ValueError if ffmpeg fails.
+    """
+    if len(frames if frames is not None else images) == 0:
+        raise ValueError('No frames to write to '+video_name)
+    if frames is not None:
+        height, width = frames[0].shape[:2]
+        inputargs = ['-f', 'rawvideo', '-pix_fmt', 'rgb24', '-s', '%dx%d'%(width, height)]
+    else:
+        inputargs = ['-f', 'image2pipe']
+    cmd = [ffmpeg, '-y', '-loglevel', 'error'] + inputargs + \
+          ['-framerate', str(fps), '-i', '-',
+           # yuv420p needs even frame dimensions
+           '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2',
+           '-c:v', 'libx264', '-pix_fmt', 'yuv420p', video_name]
+    proc = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+    try:
+        if frames is not None:
+            for frame in frames:
+                proc.stdin.write(frame.tobytes())
+        else:
+            for image in images:
+                with open(image, 'rb') as f:
+                    proc.stdin.write(f.read())
+    except BrokenPipeError:
+        # ffmpeg quit early, its exit code is checked below
+        pass
+    except OSError:
+        # Couldn't read an image, don't leave ffmpeg waiting for input
+        proc.kill()
+        proc.communicate()
+        raise
+    # Closes stdin (ignoring a broken pipe) and waits for ffmpeg
+    proc.communicate()
+    if proc.returncode != 0:
+        raise ValueError('ffmpeg failed to write %s (exit code %i)'%(video_name, proc.returncode))
+    return
+
+def _read_images(images, nthreads=None):
+    """
+    Generator which returns cv2.imread() of each image in order.
+
+    The next few images are decoded in a thread pool while the caller
+    works on the current one (OpenCV releases the GIL when decoding).
+    """
+    import cv2
+    nthreads = os.cpu_count() if nthreads is None else nthreads
+    with ThreadPoolExecutor(max_workers=nthreads) as executor:
+        pending = deque()
+        for image in images:
+            pending.append(executor.submit(cv2.imread, image))
+            if len(pending) > nthreads:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def _render_frames_worker(frames, opts):
+    # Forked worker processes only write image files.  They are only
+    # used with the Agg backend, so there is no GUI state to touch.
+    _render_frames(frames, opts)
+    return
+
+def _can_fork_render():
+    """
+    Returns True if frames can be rendered in forked processes: fork must
+    be available and safe (not on macOS), and matplotlib must use the
+    non-interactive Agg backend
+    """
+    return ('fork' in multiprocessing.get_all_start_methods()) and \
+        (sys.platform != 'darwin') and \
+        (matplotlib.get_backend().lower() == 'agg')
+
 @registerplugin
 class postpro_instantaneousplanes():
     """
@@ -67,6 +355,10 @@ class postpro_instantaneousplanes():
          'help':'Variables to extract from the netcdf file',},        
         {'key':'savepklfile', 'required':False,  'default':'',
          'help':'Name of pickle file to save results', },
+        {'key':'lazyload', 'required':False,  'default':False,
+         'help':'Read each plane from the netcdf file only when it is plotted (plotfunc results are then not shared between actions)', },
+        {'key':'stackvarnames', 'required':False,  'default':False,
+         'help':'Stack varnames into one contiguous array.  plotfunc must then be given and index it as db[ivar, i], e.g. "lambda db, i: np.sqrt(db[0,i]**2 + db[1,i]**2)" (loads all planes)', },
 
     ]
     actionlist = {}                    # Dictionary for holding sub-actions
@@ -144,9 +436,26 @@ instantaneousplanes:
             group    = plane['group']
             varnames = plane['varnames']
             self.iplane = plane['iplane']
+            lazyload = plane['lazyload']
+            stackvarnames = plane['stackvarnames']
+
+            # Find the plotfunc expressions used by more than one action.
+            # Their results are kept for all iterations, so don't cache
+            # anything when the planes are loaded lazily.
+            plotfuncs = []
+            for a in ['plot', 'plot_radial']:
+                if a in plane:
+                    plotfuncs.append(mergedicts(plane[a], self.actionlist[a].actiondefs)['plotfunc'])
+            self.sharedplotfuncs = set() if lazyload else \
+                set(p for p in plotfuncs if plotfuncs.count(p) > 1)
+            if stackvarnames:
+                for p in plotfuncs:
+                    if _STRKEY_RE.search(p):
+                        raise ValueError('With stackvarnames the plotfunc indexes the stacked varnames as db[ivar, i], '+
+                                         'e.g. "lambda db, i: np.sqrt(db[0,i]**2 + db[1,i]**2)", not: '+p)
 
             # Load the plane
-            self.db  = ppsamplexr.getPlaneXR(ncfile, iters, varnames, groupname=group, verbose=verbose, gettimes=True, includeattr=True,timerange=self.trange,times=self.times)
+            self.db  = ppsamplexr.getPlaneXR(ncfile, iters, varnames, groupname=group, verbose=verbose, gettimes=True, includeattr=True,timerange=self.trange,times=self.times,lazy=lazyload)
 
             # Convert to native axis1/axis2 coordinates if necessary
             if ('a1' in [self.xaxis, self.yaxis]) or \
@@ -161,9 +470,17 @@ instantaneousplanes:
 
             if len(savepklfile)>0:
                 # Write out the picklefile
-                dbfile = open(savepklfile, 'wb')
-                pickle.dump(self.db, dbfile, protocol=2)
-                dbfile.close()
+                # (protocol 5+ writes the numpy array buffers without extra copies)
+                with open(savepklfile, 'wb') as dbfile:
+                    pickle.dump(ppsamplexr.loadLazyPlanes(self.db), dbfile, protocol=pickle.HIGHEST_PROTOCOL)
+
+            self.db_stack = None
+            if stackvarnames:
+                self.stackvars(varnames)
+
+            self.plotqcache = {}
+            # Rendered frames kept by plot for animate/makegif, keyed by savefile
+            self.framecache = {}
 
             # Do any sub-actions required for this task
             for a in self.actionlist:
@@ -175,8 +492,55 @@ instantaneousplanes:
                 if action.actionname in self.yamldictlist[planeiter].keys():
                     actionitem = action(self, self.yamldictlist[planeiter][action.actionname])
                     actionitem.execute()
+            self.plotqcache = {}
+            self.framecache = {}
+            ppsamplexr.closeLazyPlanes(self.db)
         return
 
+    def stackvars(self, varnames):
+        """
+        Copies the varnames planes into one array, so that all variables of
+        an iteration are next to each other in memory.  self.db_stack is a
+        [nvars, niters, nplanes, ny, nx] view of it, and self.db[v][i] are
+        replaced with views into the same memory.
+        """
+        if len(self.iters) == 0:
+            raise ValueError('No iterations to stack')
+        first = np.asarray(self.db[varnames[0]][self.iters[0]])
+        stack = np.empty((len(self.iters), len(varnames))+first.shape, dtype=first.dtype)
+        sources = {v:self.db[v] for v in varnames}
+        for v in varnames: self.db[v] = {}
+        # Fill one iteration at a time and drop each source plane once
+        # it is copied, so the planes are never held twice
+        for iplot, i in enumerate(self.iters):
+            for ivar, v in enumerate(varnames):
+                src = sources[v]
+                stack[iplot, ivar] = src.pop(i) if isinstance(src, dict) else src[i]
+                self.db[v][i] = stack[iplot, ivar]
+        self.db_stack  = stack.swapaxes(0, 1)
+        self.iterindex = {i:iplot for iplot, i in enumerate(self.iters)}
+        return
+
+    def getplotq(self, plotfuncstr, plotfunc, i):
+        """
+        Returns plotfunc(self.db, i)[self.iplane,:,:], where plotfunc is
+        the evaluated plotfuncstr.  Results are cached if more than one
+        action uses the same plotfunc expression.  If the varnames are
+        stacked, plotfunc is called as plotfunc(self.db_stack, iplot) with
+        iplot the index of iteration i.
+        """
+        if self.db_stack is not None:
+            args = (self.db_stack, self.iterindex[i])
+        else:
+            args = (self.db, i)
+        if plotfuncstr not in self.sharedplotfuncs:
+            return plotfunc(*args)[self.iplane,:,:]
+        key = (plotfuncstr, i)
+        if key not in self.plotqcache:
+            # Copy the plane so the full plotfunc result can be freed
+            self.plotqcache[key] = plotfunc(*args)[self.iplane,:,:].copy()
+        return self.plotqcache[key]
+
     @registeraction(actionlist)
     class plot():
         actionname = 'plot'
@@ -184,7 +548,7 @@ instantaneousplanes:
         required   = False
         actiondefs = [
             {'key':'title',     'required':False,  'default':'',
-            'help':'Title of the plot',},
+            'help':'Title of the plot (may use the fields {time}, {iter} or {i}, {iplane}, {iplot} with format specs, e.g. {time:.1f})',},
             {'key':'plotfunc',  'required':False,
             'default':"lambda db,i: np.sqrt(db['velocityx'][i]**2 + db['velocityy'][i]**2)",
             'help':'Function to plot (lambda expression)',},
@@ -213,7 +577,7 @@ instantaneousplanes:
             {'key':'fontsize',   'required':False,  'default':14,
             'help':'Fontsize for labels and axis', },
             {'key':'savefile',  'required':False,  'default':'',
-            'help':'Filename to save the picture', },
+            'help':'Filename to save the picture (.ppm files are written uncompressed)', },
             {'key':'postplotfunc', 'required':False,  'default':'',
             'help':'Function to call after plot is created. Function should have arguments func(fig, ax)',},
             {'key':'xscalefunc',  'required':False,  'default':'lambda x: x',
@@ -230,122 +594,94 @@ instantaneousplanes:
              'help':'Aspect ratio of figure axes (options:equal,scaled,tight,auto,image,square)'},
             {'key':'plotturbines',   'required':False,  'default':None,
              'help':'List of dictionaries which contain turbines to plot', },
+            {'key':'plotmethod',   'required':False,  'default':'contourf',
+             'help':'Method used to draw the field [Choices: contourf, pcolormesh (faster, one flat color per cell)]', },
+            {'key':'nprocs',   'required':False,  'default':1,
+             'help':'Number of processes used to render and save the frames (requires a savefile, fork and the Agg backend, not on macOS)', },
+            {'key':'cacheframes',   'required':False,  'default':False,
+             'help':'Keep the rendered frames in memory so animate/makegif with the same imagefilename do not read the images back (only with nprocs: 1)', },
 
         ]
         def __init__(self, parent, inputs):
             self.actiondict = mergedicts(inputs, self.actiondefs)
             self.parent = parent
+            # Evaluate the lambda/eval expressions once here
+            self.plotfunc = eval(self.actiondict['plotfunc'])
+            self.clevels  = eval(self.actiondict['clevels'])
+            self.xscalef  = eval(self.actiondict['xscalefunc'])
+            self.yscalef  = eval(self.actiondict['yscalefunc'])
+            self.axesnumf = None if self.actiondict['axesnumfunc'] is None else eval(self.actiondict['axesnumfunc'])
             print('Initialized '+self.actionname+' inside '+parent.name)
             return
 
         def execute(self):
             print('Executing ' + self.actionname)
-            plotfunc = eval(self.actiondict['plotfunc'])
             title    = self.actiondict['title']
-            clevels  = eval(self.actiondict['clevels'])
-            cmap     = self.actiondict['cmap']
-            cbar_inc = self.actiondict['cbar']
-            cbar_nticks = self.actiondict['cbar_nticks']
-            cbar_label = self.actiondict['cbar_label']
-            xlabel   = self.actiondict['xlabel']
-            ylabel   = self.actiondict['ylabel']
-            xlim     = self.actiondict['xlim']
-            ylim     = self.actiondict['ylim']
-            savefile = self.actiondict['savefile']
-            dpi      = self.actiondict['dpi']
-            figsize  = self.actiondict['figsize']
-            fontsize = self.actiondict['fontsize']
-            postplotfunc = self.actiondict['postplotfunc']
-            xscalef  = eval(self.actiondict['xscalefunc'])
-            yscalef  = eval(self.actiondict['yscalefunc'])
             figname  = self.actiondict['figname']
-            axesnumf = None if self.actiondict['axesnumfunc'] is None else eval(self.actiondict['axesnumfunc'])
-            axisscale= self.actiondict['axisscale']
-            plotturbs= self.actiondict['plotturbines']
+            axesnumf = self.axesnumf
+            nprocs   = self.actiondict['nprocs']
+            savefile = self.actiondict['savefile']
 
-            # Loop through each time instance and plot
+            if (self.actiondict['plotmethod'] == 'pcolormesh') and (np.ndim(self.clevels) != 1):
+                raise ValueError('plotmethod: pcolormesh needs clevels to be a list of levels')
+
+            # Split the title into LaTeX math and plain text parts once.
+            # Only plain text parts with {} fields need formatting per frame.
+            titleparts = []
+            for part in _TITLE_RE.split(title):
+                ismath = part.startswith('$') and part.endswith('$')
+                titleparts.append(((not ismath) and ('{' in part), part))
+
+            # Collect everything needed to render a frame
             iplane = self.parent.iplane
-            for iplot, i in enumerate(self.parent.iters):
-                time  = self.parent.db['times'][iplot]
-                if (figname is not None) and (axesnumf is not None):
-                    fig     = plt.figure(figname)
-                    allaxes = fig.get_axes()
-                    iax     = axesnumf(iplane)
-                    ax      = allaxes[iax]
-                else:
-                    fig, ax = plt.subplots(1,1,figsize=(figsize[0],figsize[1]), dpi=dpi)
-                plotq = plotfunc(self.parent.db, i)
-                c = ax.contourf(xscalef(self.parent.db[self.parent.xaxis][iplane,:,:]),
-                                yscalef(self.parent.db[self.parent.yaxis][iplane,:,:]),
-                                plotq[iplane, :, :], levels=clevels, cmap=cmap, extend='both')
-                if cbar_inc:
-                    divider = make_axes_locatable(ax)
-                    cax = divider.append_axes("right", size="3%", pad=0.05)
-                    cbar=fig.colorbar(c, ax=ax, cax=cax)
-                    cbar.ax.tick_params(labelsize=fontsize)
-                    if cbar_label is not None:
-                        cbar.set_label(cbar_label,fontsize=fontsize)
-
-                    if cbar_nticks is not None:
-                        levels = c.levels
-                        # Define the number of intervals
-                        min_tick = levels[0]
-                        max_tick = levels[-1]
-                        new_ticks = np.linspace(min_tick, max_tick, cbar_nticks)
-                        cbar.set_ticks(new_ticks)
-
-                if (xlabel is not None): ax.set_xlabel(xlabel,fontsize=fontsize)
-                if (ylabel is not None): ax.set_ylabel(ylabel,fontsize=fontsize)
-                ax.tick_params(axis='both', which='major', labelsize=fontsize) 
-                # SET TITLE
-                parts = re.split(r'(\$.*?\$)', title)
-                evaluated_parts = []
-                for part in parts:
-                    if part.startswith('$') and part.endswith('$'):
-                        # This part is inside LaTeX math mode, leave it as is
-                        evaluated_parts.append(part)
-                    else:
-                        # This part is outside LaTeX math mode, evaluate it
-                        evaluated_parts.append(eval(f"rf'{part}'"))
-                evaltitle = ''.join(evaluated_parts)
-                ax.set_title(evaltitle,fontsize=fontsize)
-                if axisscale is not None:
-                    ax.axis(axisscale)
-
-                if xlim is not None:
-                    ax.set_xlim(xlim[0],xlim[1])
-
-                if ylim is not None:
-                    ax.set_ylim(ylim[0],ylim[1])
-
-                # Plot turbines
-                if plotturbs:
-                    axismapping = {'x':0, 'a1':0, 'y':1, 'a2':1, 'z':2, 'a3':2}
-                    defaultlstyle =  {'lw':1, 'color':'k', 'alpha':0.75}
-                    for turb in plotturbs:
-                        basexyz   = turb['basexyz']
-                        hubheight = turb['hubheight']
-                        turbD     = turb['rotordiameter']
-                        nacelledir= turb['nacelledir']
-                        ix        = turb['ix'] if 'ix' in turb else axismapping[self.parent.xaxis]
-                        iy        = turb['iy'] if 'iy' in turb else axismapping[self.parent.yaxis]
-                        lstyle    = turb['linestyle'] if 'linestyle' in turb else defaultlstyle
-                        plotfunctions.plotTurbine(ax, basexyz, hubheight, turbD, nacelledir, ix, iy,
-                                                  **lstyle)
-
-                # Run any post plot functions
-                if len(postplotfunc)>0:
-                    modname = postplotfunc.split('.')[0]
-                    funcname = postplotfunc.split('.')[1]
-                    func = getattr(sys.modules[modname], funcname)
-                    func(fig, ax)
+            usefig = (figname is not None) and (axesnumf is not None)
+            opts   = dict(self.actiondict)
+            opts.update({'clevels':    self.clevels,
+                         'titleparts': titleparts,
+                         'axesnum':    axesnumf(iplane) if usefig else None,
+                         'iplane':     iplane,
+                         'xaxis':      self.parent.xaxis,
+                         'yaxis':      self.parent.yaxis,
+                         # The scaled coordinates don't change between frames
+                         'xgrid':      self.xscalef(self.parent.db[self.parent.xaxis][iplane,:,:]),
+                         'ygrid':      self.yscalef(self.parent.db[self.parent.yaxis][iplane,:,:]),
+            })
 
-                if len(savefile)>0:
-                    savefname = savefile.format(time=time, iplane=iplane, iter=i)
-                    directory, file_name = os.path.split(savefname)
-                    directory += '/'
-                    os.makedirs(directory, exist_ok=True)
-                    plt.savefig(savefname)
+            # Loop through each time instance and plot
+            frames   = [(iplot, i, self.parent.db['times'][iplot]) for iplot, i in enumerate(self.parent.iters)]
+            if len(frames)>0:
+                # Check the title fields before rendering anything
+                iplot, i, time = frames[0]
+                _format_title(titleparts, {'time':time, 'iter':i, 'i':i, 'iplane':iplane, 'iplot':iplot})
+            if len(savefile)>0:
+                _makedirs([savefile.format(time=time, iplane=iplane, iter=i) for iplot, i, time in frames])
+            getplotq = lambda i: self.parent.getplotq(self.actiondict['plotfunc'], self.plotfunc, i)
+            useprocs = (nprocs > 1) and (not usefig) and (len(frames) > 1) and (len(savefile)>0)
+            if useprocs and not _can_fork_render():
+                print('nprocs > 1 needs fork and the Agg backend, rendering serially')
+                useprocs = False
+            if useprocs:
+                # Each forked process evaluates and renders a contiguous
+                # chunk of frames.  Nothing needs to be pickled since the
+                # children inherit the db and the plot functions.
+                ctx = multiprocessing.get_context('fork')
+                chunksize = int(np.ceil(len(frames)/nprocs))
+                procs = []
+                for k in range(0, len(frames), chunksize):
+                    chunk = ((iplot, i, time, getplotq(i)) for iplot, i, time in frames[k:k+chunksize])
+                    proc  = ctx.Process(target=_render_frames_worker, args=(chunk, opts))
+                    proc.start()
+                    procs.append(proc)
+                for proc in procs:
+                    proc.join()
+                nfailed = sum(proc.exitcode != 0 for proc in procs)
+                if nfailed > 0:
+                    raise ValueError('Rendering frames failed in %i process(es)'%nfailed)
+            else:
+                rendered = _render_frames(((iplot, i, time, getplotq(i)) for iplot, i, time in frames), opts)
+                if self.actiondict['cacheframes']:
+                    self.parent.framecache[savefile] = rendered
+            return
         
 
     # --- Inner classes for action list ---
@@ -384,18 +720,34 @@ instantaneousplanes:
             os.makedirs(directory, exist_ok=True)
             fps = self.actiondict['fps']
             imagefilename = self.actiondict['imagefilename']
-            images = []
             iplane = self.parent.iplane
             #sort images by time
             iters = self.parent.iters
-            for iplot, i in enumerate(iters):
-                time  = self.parent.db['times'][iplot]
-                images.append(imagefilename.format(time=time, iplane=iplane,iter=i))
-            frame = cv2.imread(os.path.join(images[0]))
+            times = self.parent.db['times']
+            images = [imagefilename.format(time=time, iplane=iplane, iter=i) for time, i in zip(times, iters)]
+            if len(images) == 0:
+                raise ValueError('No images to write to '+video_name)
+            # Use the frames kept in memory by plot if there are any
+            cached = self.parent.framecache.get(imagefilename)
+            ffmpeg = shutil.which('ffmpeg')
+            if ffmpeg is not None:
+                try:
+                    _ffmpeg_encode(ffmpeg, video_name, fps, images=images, frames=cached)
+                    return
+                except ValueError as e:
+                    print(str(e)+', using OpenCV instead')
+            # No (working) ffmpeg available, encode with OpenCV
+            import cv2
+            if cached is not None:
+                frames = (cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR) for rgb in cached)
+            else:
+                frames = _read_images(images)
+            frame  = next(frames)
             height, width, layers = frame.shape
             video = cv2.VideoWriter(video_name, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
-            for image in images:
-                video.write(cv2.imread(os.path.join(image)))
+            video.write(frame)
+            for frame in frames:
+                video.write(frame)
             cv2.destroyAllWindows()
             video.release()
             return
@@ -436,27 +788,26 @@ instantaneousplanes:
                 times = None
                 override_times = False
 
-            images = []
             iplane = self.parent.iplane
             #sort images by time
             if override_times:
-                iters = range(len(times))
+                # The overridden times have no iteration numbers for {iter}
+                images = [imagefilename.format(time=time, iplane=iplane) for time in times]
             else:
                 iters = self.parent.iters
-            for iplot, i in enumerate(iters):
-                if override_times:
-                    time = times[iplot]
-                else:
-                    time  = self.parent.db['times'][iplot]
-                images.append(imagefilename.format(time=time, iplane=iplane))
+                times = self.parent.db['times']
+                images = [imagefilename.format(time=time, iplane=iplane, iter=i) for time, i in zip(times, iters)]
 
             # Create an animated GIF from the movie frames
+            cached = self.parent.framecache.get(imagefilename)
+            if (cached is not None) and (not override_times):
+                imageio.mimsave(video_name, cached, fps=fps)
+                return
             imagedat=[]
-            for f in images:
-                img = cv2.imread(f)
+            for img in _read_images(images):
                 if img is not None:
-                    img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-                    imagedat.append(img_rgb)
+                    # BGR to RGB is just a reversed view of the channels
+                    imagedat.append(img[..., ::-1])
             imageio.mimsave(video_name, imagedat, fps=fps)
             return
 
@@ -495,12 +846,14 @@ instantaneousplanes:
         def __init__(self, parent, inputs):
             self.actiondict = mergedicts(inputs, self.actiondefs)
             self.parent = parent
+            self.plotfunc = eval(self.actiondict['plotfunc'])
             print('Initialized '+self.actionname+' inside '+parent.name)
             return
 
         def execute(self):
             print('Executing ' + self.actionname)
-            plotfunc = eval(self.actiondict['plotfunc'])
+            from postproengine import spod
+            plotfunc = self.plotfunc
             title    = self.actiondict['title']
             cmap     = self.actiondict['cmap']
             cbar_inc = self.actiondict['cbar']
@@ -520,16 +873,23 @@ instantaneousplanes:
             theta = np.linspace(0,LTheta,NTheta+1)[0:-1] #periodic grid in theta
             RR, TT = np.meshgrid(r,theta,indexing='ij')
 
-            # Loop through each time instance and plot
+            # The grids are the same for all times, so compute the
+            # interpolation stencil only once
             iplane = self.parent.iplane
+            y = self.parent.db['y'][iplane,0,:]
+            z = self.parent.db['z'][iplane,:,0]
+            idx, w = spod.build_bilinear_weights(y,z,RR,TT,xcenter,ycenter)
+
+            if len(savefile)>0:
+                _makedirs([savefile.format(time=time, iplane=iplane) for time in self.parent.db['times']])
+
+            # Loop through each time instance and plot
             for iplot, i in enumerate(self.parent.iters):
-                y = self.parent.db['y'][iplane,0,:]
-                z = self.parent.db['z'][iplane,:,0]
                 time  = self.parent.db['times'][iplot]
                 fig, ax = plt.subplots(figsize=(figsize[0],figsize[1]),subplot_kw={'projection':'polar'},dpi=dpi)
                 LR = r[-1]
-                plotq = plotfunc(self.parent.db,i)
-                Ur = spod.interpolate_cart_to_radial(plotq[iplane,:,:],y,z,RR,TT,xcenter,ycenter)
+                plotq = self.parent.getplotq(self.actiondict['plotfunc'], plotfunc, i)
+                Ur = spod.apply_bilinear_weights(plotq,idx,w,RR.shape)
                 if vmin == None or vmax == None:
                     im = ax.pcolormesh(theta,r,Ur,cmap=cmap)
                 else:
@@ -548,8 +908,5 @@ instantaneousplanes:
                 if len(savefile)>0:
                     savefname = savefile.format(time=time, iplane=iplane)
                     print('Saving '+savefname)
-                    directory, file_name = os.path.split(savefname)
-                    directory += '/'
-                    os.makedirs(directory, exist_ok=True)
                     plt.savefig(savefname)
 
@@ -24,6 +24,12 @@ import time
 import matplotlib.pyplot as plt
 from itertools import product
 
+try:
+    from numba import njit, prange
+    hasnumba = True
+except:
+    hasnumba = False
+
 def get_mode_number(numModes,sorted_inds,variables,corr,Uinf,diam,St=None,ktheta=None,tol=None):
     inds = [] 
     ktheta_vals = variables['ktheta']
@@ -433,15 +439,103 @@ def interpolate_radial_to_cart(U,rr,theta,YY,ZZ,offsety,offsetz):
     U_interp = np.reshape(U_interp,(YR.shape[0],ZR.shape[1]))
     return U_interp
 
+if hasnumba:
+    @njit(parallel=True)
+    def _interp_cart_to_radial_numba(U,yy,zz,RR,TT,offsety,offsetz,U_interp):
+        """
+        Bilinear interpolation of U(zz,yy) onto the polar grid RR,TT.
+        yy and zz must be strictly ascending.  Returns the number of polar
+        points outside of the cartesian grid (those are set to nan).
+        """
+        ny = yy.shape[0]
+        nz = zz.shape[0]
+        dyinv = (ny-1)/(yy[ny-1] - yy[0])
+        dzinv = (nz-1)/(zz[nz-1] - zz[0])
+        noutside = 0
+        for i in prange(RR.shape[0]):
+            for j in range(RR.shape[1]):
+                y = RR[i,j] * np.cos(TT[i,j]) + offsety
+                z = RR[i,j] * np.sin(TT[i,j]) + offsetz
+                if (y < yy[0]) or (y > yy[ny-1]) or (z < zz[0]) or (z > zz[nz-1]):
+                    noutside += 1
+                    U_interp[i,j] = np.nan
+                    continue
+                # Guess the cell assuming uniform spacing, then correct it
+                iy = min(int((y - yy[0])*dyinv), ny-2)
+                iz = min(int((z - zz[0])*dzinv), nz-2)
+                while (iy > 0) and (yy[iy] > y): iy -= 1
+                while (iy < ny-2) and (yy[iy+1] < y): iy += 1
+                while (iz > 0) and (zz[iz] > z): iz -= 1
+                while (iz < nz-2) and (zz[iz+1] < z): iz += 1
+                wy = (y - yy[iy])/(yy[iy+1] - yy[iy])
+                wz = (z - zz[iz])/(zz[iz+1] - zz[iz])
+                U_interp[i,j] = (1.0-wz)*((1.0-wy)*U[iz,iy] + wy*U[iz,iy+1]) + \
+                                wz*((1.0-wy)*U[iz+1,iy] + wy*U[iz+1,iy+1])
+        return noutside
+
 def interpolate_cart_to_radial(U,yy,zz,RR,TT,offsety,offsetz):
+    if hasnumba and np.all(np.diff(yy) > 0) and np.all(np.diff(zz) > 0):
+        U_interp = np.empty(RR.shape)
+        noutside = _interp_cart_to_radial_numba(np.ascontiguousarray(U, dtype=np.float64),
+                                                np.asarray(yy, dtype=np.float64),
+                                                np.asarray(zz, dtype=np.float64),
+                                                np.asarray(RR, dtype=np.float64),
+                                                np.asarray(TT, dtype=np.float64),
+                                                float(offsety), float(offsetz), U_interp)
+        if noutside > 0:
+            raise ValueError('%i points of the radial grid are outside of the cartesian grid'%noutside)
+        return U_interp
     YY_interp = RR * np.cos(TT) + offsety
     ZZ_interp = RR * np.sin(TT) + offsetz
     grid = (ZZ_interp,YY_interp)
     positions = np.vstack(list(map(np.ravel,grid))).T
     U_interp = sp.interpolate.interpn((zz,yy),U,positions,method='linear')
-    U_interp = np.reshape(U_interp,(RR.shape[0],TT.shape[0]))
+    U_interp = np.reshape(U_interp,RR.shape)
     return U_interp
 
+def build_bilinear_weights(yy,zz,RR,TT,offsety,offsetz):
+    """
+    Precompute the bilinear interpolation stencil from the cartesian grid
+    (zz,yy) onto the polar grid RR,TT.  yy and zz must be strictly
+    ascending or descending.
+
+    Returns idx, w, both of shape (4, RR.size), such that
+    apply_bilinear_weights(U, idx, w, RR.shape) gives the same result as
+    interpolate_cart_to_radial(U,yy,zz,RR,TT,offsety,offsetz)
+    """
+    yy = np.asarray(yy)
+    zz = np.asarray(zz)
+    ny = len(yy)
+    nz = len(zz)
+    # Work with ascending axes, the indices are mapped back to U below
+    flipy = yy[-1] < yy[0]
+    flipz = zz[-1] < zz[0]
+    if flipy: yy = yy[::-1]
+    if flipz: zz = zz[::-1]
+    if not (np.all(np.diff(yy) > 0) and np.all(np.diff(zz) > 0)):
+        raise ValueError('The cartesian grid coordinates must be strictly ascending or descending')
+    YY_interp = (RR * np.cos(TT) + offsety).ravel()
+    ZZ_interp = (RR * np.sin(TT) + offsetz).ravel()
+    outside = (YY_interp < yy[0]) | (YY_interp > yy[-1]) | (ZZ_interp < zz[0]) | (ZZ_interp > zz[-1])
+    if np.any(outside):
+        raise ValueError('%i points of the radial grid are outside of the cartesian grid'%np.count_nonzero(outside))
+    iy = np.clip(np.searchsorted(yy, YY_interp)-1, 0, ny-2)
+    iz = np.clip(np.searchsorted(zz, ZZ_interp)-1, 0, nz-2)
+    wy = (YY_interp - yy[iy])/(yy[iy+1] - yy[iy])
+    wz = (ZZ_interp - zz[iz])/(zz[iz+1] - zz[iz])
+    # Columns/rows of U on either side of each point
+    iy0, iy1 = (ny-1-iy, ny-2-iy) if flipy else (iy, iy+1)
+    iz0, iz1 = (nz-1-iz, nz-2-iz) if flipz else (iz, iz+1)
+    idx = np.array([iz0*ny + iy0, iz0*ny + iy1, iz1*ny + iy0, iz1*ny + iy1])
+    w   = np.array([(1.0-wz)*(1.0-wy), (1.0-wz)*wy, wz*(1.0-wy), wz*wy])
+    return idx, w
+
+def apply_bilinear_weights(U,idx,w,shape):
+    """
+    Interpolate U using the stencil from build_bilinear_weights()
+    """
+    return np.sum(np.ravel(U)[idx]*w, axis=0).reshape(shape)
+
 def compute_stft(x, fs=1.0, nperseg=256, noverlap=None, window='hamming',subtract_mean=False):
     """
     Compute the Short-Time Fourier Transform (STFT) of a signal using scipy.